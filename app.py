@@ -1,10 +1,23 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from transformers import pipeline
+from transformers import AutoTokenizer, pipeline
+from transformers.modeling_outputs import SequenceClassifierOutput
 import uvicorn
-from typing import List, Dict
+from typing import List, Dict, Tuple
+from collections import OrderedDict
+from numba import njit
+import asyncio
 import logging
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+import orjson
+import torch
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -13,8 +26,9 @@ logger = logging.getLogger(__name__)
 # Initialize FastAPI app
 app = FastAPI(
     title="Sentiment Analysis API",
-    description="Real-time sentiment analysis using DistilBERT",
-    version="1.0.0"
+    description="Real-time sentiment analysis using a distilled transformer",
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -26,19 +40,357 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load the sentiment analysis model
-logger.info("Loading DistilBERT model...")
+@app.on_event("startup")
+async def start_batcher():
+    """Start the background micro-batching task"""
+    global _batcher_task, _pending_event
+    _pending_event = asyncio.Event()  # Created here so it belongs to the running loop
+    _batcher_task = asyncio.create_task(_batcher())
+    _batcher_task.add_done_callback(_on_batcher_done)
+
+@app.on_event("startup")
+async def warmup():
+    """Warm up the model in each serving process, not in a preloading master"""
+    if sentiment_pipeline is not None:
+        await run_in_threadpool(warmup_model)
+
+# Use the cores assigned to this process (OMP_NUM_THREADS is set per worker
+# when running several workers) and the x86 INT8 GEMM backend
+NUM_THREADS = int(os.environ.get("OMP_NUM_THREADS", os.cpu_count()))
+torch.set_num_threads(NUM_THREADS)
+torch.set_num_interop_threads(1)  # Must be set before any parallel work runs
+if "fbgemm" in torch.backends.quantized.supported_engines:
+    torch.backends.quantized.engine = "fbgemm"
+
+# Distilled 6-layer MiniLM by default; override with any SST-2 style classifier
+MODEL_ID = os.environ.get("MODEL_ID", "philschmid/MiniLM-L6-H384-uncased-sst2")
+# Where the exported ONNX model is cached; next to this file unless overridden
+ONNX_DIR = os.environ.get("ONNX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx"))
+
+# Truncate to 128 tokens and pad batches only to their longest member; most
+# 512-character inputs fit in 128 tokens and attention cost grows with length
+MAX_TOKENS = 128
+TOKENIZER_KWARGS = {"truncation": True, "max_length": MAX_TOKENS, "padding": "longest"}
+
+# Run on the first GPU in half precision when CUDA is available
+DEVICE = 0 if torch.cuda.is_available() else -1
+
+# ONNX Runtime is optional; fall back to PyTorch when Optimum isn't installed
+try:
+    import onnxruntime
+    from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+except ImportError:
+    ORTModelForSequenceClassification = None
+
+def _onnx_model_dir():
+    """Export and quantize the model to ONNX on first use and return its directory"""
+    model_dir = os.path.join(ONNX_DIR, MODEL_ID.replace("/", "--"))
+    if not os.path.exists(os.path.join(model_dir, "model_quantized.onnx")):
+        logger.info("Exporting model to ONNX...")
+        # Export into a temporary directory and rename it into place, so workers
+        # starting at the same time never load a half-written model
+        os.makedirs(ONNX_DIR, exist_ok=True)
+        export_dir = tempfile.mkdtemp(dir=ONNX_DIR)
+        ort_model = ORTModelForSequenceClassification.from_pretrained(MODEL_ID, export=True)
+        ort_model.save_pretrained(export_dir)
+        AutoTokenizer.from_pretrained(MODEL_ID).save_pretrained(export_dir)
+
+        quantizer = ORTQuantizer.from_pretrained(ort_model)
+        qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=True)
+        quantizer.quantize(save_dir=export_dir, quantization_config=qconfig)
+        try:
+            os.rename(export_dir, model_dir)
+        except OSError:
+            # Another process finished its export first
+            shutil.rmtree(export_dir, ignore_errors=True)
+    return model_dir
+
+def _load_onnx_model():
+    """Open an ONNX Runtime session on the quantized model"""
+    session_options = onnxruntime.SessionOptions()
+    session_options.intra_op_num_threads = NUM_THREADS
+    return ORTModelForSequenceClassification.from_pretrained(
+        _onnx_model_dir(), file_name="model_quantized.onnx", session_options=session_options
+    )
+
+def _load_onnx_pipeline():
+    """Wrap the quantized ONNX model in a sentiment-analysis pipeline"""
+    tokenizer = AutoTokenizer.from_pretrained(_onnx_model_dir())
+    return pipeline("sentiment-analysis", model=_load_onnx_model(), tokenizer=tokenizer)
+
+# Intel Extension for PyTorch is optional; it enables BF16 kernels on recent Xeons
 try:
-    sentiment_pipeline = pipeline(
+    import intel_extension_for_pytorch as ipex
+except ImportError:
+    ipex = None
+
+class _LogitsModule(torch.nn.Module):
+    """Return only the logits tensor so the model can be traced"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask, return_dict=False)[0]
+
+class _TracedClassifier(torch.nn.Module):
+    """Run a traced logits module behind the interface the pipeline expects"""
+
+    def __init__(self, module, config, bf16=False):
+        super().__init__()
+        self.module = module
+        self.config = config
+        self.bf16 = bf16
+
+    def forward(self, input_ids, attention_mask, **kwargs):
+        with torch.inference_mode(), torch.cpu.amp.autocast(enabled=self.bf16, dtype=torch.bfloat16):
+            logits = self.module(input_ids, attention_mask)
+        return SequenceClassifierOutput(logits=logits.float())
+
+def _trace_model(model, tokenizer):
+    """Trace and freeze the model into a TorchScript graph, falling back to eager mode"""
+    module = _LogitsModule(model).eval()
+    example = tokenizer("x", return_tensors="pt", padding="max_length", max_length=MAX_TOKENS)
+    # Trace on a single thread: in a preloaded gunicorn master this runs before
+    # the workers are forked, and OpenMP thread pools don't survive fork()
+    torch.set_num_threads(1)
+    try:
+        with torch.no_grad(), torch.cpu.amp.autocast(enabled=ipex is not None, dtype=torch.bfloat16):
+            traced = torch.jit.trace(module, (example['input_ids'], example['attention_mask']), strict=False)
+            module = torch.jit.freeze(traced)
+    except Exception as e:
+        logger.warning(f"TorchScript tracing failed, using eager model: {e}")
+    finally:
+        torch.set_num_threads(NUM_THREADS)
+    return _TracedClassifier(module, model.config, bf16=ipex is not None)
+
+def _load_torch_pipeline():
+    """Load the PyTorch model, optimize it for CPU and trace it with TorchScript"""
+    pipe = pipeline(
         "sentiment-analysis",
-        model="distilbert-base-uncased-finetuned-sst-2-english",
-        device=-1  # Use CPU; change to 0 for GPU
+        model=MODEL_ID,
+        device=-1
     )
+    pipe.model.eval()
+    if ipex is not None:
+        # BF16 on CPUs with AMX/AVX512-BF16 instead of INT8 quantization
+        pipe.model = ipex.optimize(pipe.model, dtype=torch.bfloat16)
+    else:
+        # Quantize Linear layers to INT8
+        pipe.model = torch.quantization.quantize_dynamic(
+            pipe.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    pipe.model = _trace_model(pipe.model, pipe.tokenizer)
+    return pipe
+
+def _load_gpu_pipeline():
+    """Load the PyTorch model onto the GPU in FP16"""
+    pipe = pipeline(
+        "sentiment-analysis",
+        model=MODEL_ID,
+        device=DEVICE,
+        torch_dtype=torch.float16
+    )
+    pipe.model.eval()
+    return pipe
+
+# Load the sentiment analysis model
+logger.info(f"Loading {MODEL_ID} model...")
+try:
+    if DEVICE >= 0:
+        sentiment_pipeline = _load_gpu_pipeline()
+    elif ORTModelForSequenceClassification is not None:
+        try:
+            sentiment_pipeline = _load_onnx_pipeline()
+        except Exception as e:
+            # e.g. ONNX_DIR not writable, offline on first start, export errors
+            logger.error(f"Error loading ONNX model, falling back to PyTorch: {e}")
+            sentiment_pipeline = _load_torch_pipeline()
+    else:
+        sentiment_pipeline = _load_torch_pipeline()
     logger.info("Model loaded successfully!")
 except Exception as e:
     logger.error(f"Error loading model: {e}")
     sentiment_pipeline = None
 
+# Predictions whose top score falls below this are reported as NEUTRAL
+NEUTRAL_THRESHOLD = 0.6
+
+@njit(cache=True)
+def _postprocess(scores, threshold):
+    """Return each row's top class index (-1 below the threshold) and its score"""
+    codes = np.empty(scores.shape[0], np.int8)
+    confidences = np.empty(scores.shape[0], np.float32)
+    for i in range(scores.shape[0]):
+        best = 0
+        for j in range(1, scores.shape[1]):
+            if scores[i, j] > scores[i, best]:
+                best = j
+        confidences[i] = scores[i, best]
+        codes[i] = -1 if scores[i, best] < threshold else best
+    return codes, confidences
+
+# For the TorchScript model, single texts are padded to the fixed [1, MAX_TOKENS]
+# shape it is traced with, in buffers allocated once and reused for every call.
+# Other backends gain nothing from the padding and tokenize to the text's length
+_single_inputs = {
+    name: torch.zeros(1, MAX_TOKENS, dtype=torch.long)
+    for name in ("input_ids", "attention_mask", "token_type_ids")
+}
+_single_lock = threading.Lock()
+
+def _single_logits(text: str):
+    """Run one text through the model using the preallocated input buffers"""
+    tokenizer = sentiment_pipeline.tokenizer
+    input_ids = tokenizer(text, truncation=True, max_length=MAX_TOKENS, return_tensors="np")['input_ids'][0]
+    length = input_ids.shape[0]
+    with _single_lock:
+        _single_inputs['input_ids'][0, :length] = torch.from_numpy(input_ids)
+        _single_inputs['input_ids'][0, length:] = tokenizer.pad_token_id
+        _single_inputs['attention_mask'][0, :length] = 1
+        _single_inputs['attention_mask'][0, length:] = 0
+        # token_type_ids stay all zeros; only pass them to models that take them
+        inputs = {name: _single_inputs[name] for name in tokenizer.model_input_names}
+        with torch.inference_mode():
+            return sentiment_pipeline.model(**inputs).logits
+
+def _classify(texts: List[str]) -> List[Tuple[str, float]]:
+    """Tokenize and classify texts in one padded forward pass"""
+    if len(texts) == 1 and isinstance(sentiment_pipeline.model, _TracedClassifier):
+        logits = _single_logits(texts[0])
+    else:
+        inputs = sentiment_pipeline.tokenizer(texts, return_tensors="pt", **TOKENIZER_KWARGS)
+        inputs = inputs.to(sentiment_pipeline.device)
+        with torch.inference_mode():
+            logits = sentiment_pipeline.model(**inputs).logits
+    scores = torch.softmax(logits.float(), dim=-1).cpu().numpy()
+    codes, confidences = _postprocess(scores, NEUTRAL_THRESHOLD)
+
+    # Labels are upper-cased since models differ in casing (e.g. "positive")
+    id2label = sentiment_pipeline.model.config.id2label
+    labels = ["NEUTRAL" if code < 0 else id2label[code].upper() for code in codes.tolist()]
+    # Round the whole batch at once rather than each response
+    return list(zip(labels, confidences.astype(np.float64).round(4).tolist()))
+
+# LRU cache of (label, score) predictions keyed on the truncated text, shared by
+# the API endpoints and the Gradio UI so repeated inputs skip the model entirely
+CACHE_SIZE = 4096
+
+_cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _cache_get(text: str):
+    """Return the cached prediction for a text, or None"""
+    with _cache_lock:
+        prediction = _cache.get(text)
+        if prediction is not None:
+            _cache.move_to_end(text)
+        return prediction
+
+def _cache_put(text: str, prediction: Tuple[str, float]):
+    """Store a prediction, evicting the least recently used entry when full"""
+    with _cache_lock:
+        _cache[text] = prediction
+        _cache.move_to_end(text)
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+def _predict_batch(texts: List[str]) -> List[Tuple[str, float]]:
+    """Classify several truncated texts in one forward pass and cache the results"""
+    predictions = _classify(texts)
+    for text, prediction in zip(texts, predictions):
+        _cache_put(text, prediction)
+    return predictions
+
+def predict_sentiment(text: str) -> Tuple[str, float]:
+    """Synchronously predict (label, score) for a truncated text, using the cache"""
+    prediction = _cache_get(text)
+    if prediction is None:
+        prediction = _classify([text])[0]
+        _cache_put(text, prediction)
+    return prediction
+
+def warmup_model():
+    """Run throwaway predictions so the first request hits warm kernels and caches"""
+    try:
+        for length in (16, 64, 128):
+            _classify(["x " * length])      # Single-text path
+            _classify(["x " * length] * 2)  # Batched path
+        logger.info("Warmup complete")
+    except Exception as e:
+        logger.warning(f"Warmup failed: {e}")
+
+# Micro-batching: concurrent requests are queued here and a background task
+# runs them through the model together in a single batched forward pass
+BATCH_MAX_SIZE = 32 if DEVICE >= 0 else 16  # GPUs benefit from larger batches
+BATCH_TIMEOUT = 0.01  # seconds to wait for a batch to fill up
+MAX_BATCH_TEXTS = 64  # Limit on texts per /batch-analyze request
+
+_pending: List[Tuple[str, asyncio.Future]] = []
+_pending_event = None
+_batcher_task = None
+
+async def _batcher():
+    """Collect pending texts and run them through the model in batches"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await _pending_event.wait()
+
+        # Give other requests a short window to join the batch
+        deadline = loop.time() + BATCH_TIMEOUT
+        while len(_pending) < BATCH_MAX_SIZE and loop.time() < deadline:
+            await asyncio.sleep(0.001)
+
+        batch = _pending[:BATCH_MAX_SIZE]
+        del _pending[:BATCH_MAX_SIZE]
+        if not _pending:
+            _pending_event.clear()
+
+        # Skip requests whose callers have gone away
+        batch = [(text, future) for text, future in batch if not future.done()]
+        if not batch:
+            continue
+
+        texts = [text for text, _ in batch]
+        try:
+            predictions = await run_in_threadpool(_predict_batch, texts)
+        except Exception as e:
+            logger.error(f"Error in batched inference: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+
+        for (_, future), prediction in zip(batch, predictions):
+            if not future.done():
+                future.set_result(prediction)
+
+def _on_batcher_done(task: asyncio.Task):
+    """Log why the batcher stopped and fail the requests still waiting on it"""
+    if not task.cancelled():
+        logger.error(f"Batching task stopped: {task.exception()!r}")
+    error = RuntimeError("Batching task is not running")
+    for _, future in _pending:
+        if not future.done():
+            future.set_exception(error)
+    _pending.clear()
+
+async def _submit(text: str) -> Tuple[str, float]:
+    """Return the cached prediction for a text, or queue it for the batcher"""
+    prediction = _cache_get(text)
+    if prediction is not None:
+        return prediction
+
+    if _batcher_task is None or _batcher_task.done():
+        raise RuntimeError("Batching task is not running")
+
+    future = asyncio.get_running_loop().create_future()
+    _pending.append((text, future))
+    _pending_event.set()
+    return await future
+
 # Request/Response models
 class TextInput(BaseModel):
     text: str
@@ -49,22 +401,24 @@ class SentimentOutput(BaseModel):
     text: str
     sentiment: str
     confidence: float
-    all_scores: List[Dict[str, Union[str, float]]]
+    all_scores: List[Dict[str, Union[str, float]]] = []
 
 
 class BatchTextInput(BaseModel):
     texts: List[str]
+    stream: bool = False  # Stream results as newline-delimited JSON
 
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
     return {
         "message": "Sentiment Analysis API",
-        "model": "distilbert-base-uncased-finetuned-sst-2-english",
+        "model": MODEL_ID,
         "endpoints": {
             "/analyze": "POST - Analyze single text",
             "/batch-analyze": "POST - Analyze multiple texts",
-            "/health": "GET - Check API health"
+            "/health": "GET - Check API health",
+            "/ui": "GET - Interactive Gradio UI"
         }
     }
 
@@ -90,34 +444,43 @@ async def analyze_sentiment(input_data: TextInput):
     if sentiment_pipeline is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
-    if not input_data.text.strip():
+    text = input_data.text[:512].strip()  # Limit to 512 chars before stripping
+    if not text:
         raise HTTPException(status_code=400, detail="Text cannot be empty")
     
     try:
-        # Get prediction
-        result = sentiment_pipeline(input_data.text[:512])[0]  # Limit to 512 chars
-        
-        # Map label to our categories
-        sentiment = result['label']
-        confidence = result['score']
-        
-        # Determine neutral threshold
-        if confidence < 0.6:
-            sentiment = "NEUTRAL"
+        # Get prediction; low-confidence predictions come back as NEUTRAL
+        sentiment, confidence = await _submit(text)
         
         return SentimentOutput(
             text=input_data.text,
             sentiment=sentiment,
-            confidence=round(confidence, 4),
-            all_scores=[{
-                "label": result['label'],
-                "score": round(result['score'], 4)
-            }]
+            confidence=confidence
         )
     except Exception as e:
         logger.error(f"Error analyzing sentiment: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _stream_results(texts: List[str], truncated: List[str]):
+    """Yield each result as a JSON line as soon as the batcher produces it"""
+    predictions = [asyncio.ensure_future(_submit(text)) for text in truncated]
+    try:
+        for text, prediction in zip(texts, predictions):
+            sentiment, confidence = await prediction
+            yield orjson.dumps({
+                "text": text,
+                "sentiment": sentiment,
+                "confidence": confidence
+            }) + b"\n"
+    except Exception as e:
+        logger.error(f"Error in streamed batch analysis: {e}")
+        raise
+    finally:
+        # The client disconnected or a prediction failed; don't leave the rest running
+        for prediction in predictions:
+            if not prediction.done():
+                prediction.cancel()
+
 @app.post("/batch-analyze")
 async def batch_analyze_sentiment(input_data: BatchTextInput):
     """
@@ -127,7 +490,8 @@ async def batch_analyze_sentiment(input_data: BatchTextInput):
         input_data: BatchTextInput object containing list of texts
         
     Returns:
-        List of sentiment results
+        List of sentiment results, or an NDJSON stream of them when
+        input_data.stream is set
     """
     if sentiment_pipeline is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
@@ -136,21 +500,35 @@ async def batch_analyze_sentiment(input_data: BatchTextInput):
         raise HTTPException(status_code=400, detail="Texts list cannot be empty")
     
     try:
+        texts, truncated = [], []
+        for text in input_data.texts[:MAX_BATCH_TEXTS]:
+            snippet = text[:512].strip()  # Limit to 512 chars before stripping
+            if snippet:
+                texts.append(text)
+                truncated.append(snippet)
+
+        if input_data.stream:
+            return StreamingResponse(_stream_results(texts, truncated), media_type="application/x-ndjson")
+
+        # Forward all uncached texts together in a single padded batch
+        predictions = [_cache_get(text) for text in truncated]
+        uncached = list(dict.fromkeys(
+            text for text, prediction in zip(truncated, predictions) if prediction is None
+        ))
+        if uncached:
+            computed = dict(zip(uncached, await run_in_threadpool(_predict_batch, uncached)))
+            predictions = [
+                prediction if prediction is not None else computed[text]
+                for text, prediction in zip(truncated, predictions)
+            ]
+
         results = []
-        for text in input_data.texts[:10]:  # Limit to 10 texts per batch
-            if text.strip():
-                result = sentiment_pipeline(text[:512])[0]
-                sentiment = result['label']
-                confidence = result['score']
-                
-                if confidence < 0.6:
-                    sentiment = "NEUTRAL"
-                
-                results.append({
-                    "text": text,
-                    "sentiment": sentiment,
-                    "confidence": round(confidence, 4)
-                })
+        for text, (sentiment, confidence) in zip(texts, predictions):
+            results.append({
+                "text": text,
+                "sentiment": sentiment,
+                "confidence": confidence
+            })
         
         return {"results": results}
     except Exception as e:
@@ -158,18 +536,14 @@ async def batch_analyze_sentiment(input_data: BatchTextInput):
         raise HTTPException(status_code=500, detail=str(e))
     
 import gradio as gr
-import threading
 
 # --- Interactive Gradio UI Function ---
 def gradio_sentiment(text):
-    if not text.strip():
+    snippet = text[:512].strip()
+    if not snippet:
         return {"Error": "Text cannot be empty."}
-    result = sentiment_pipeline(text[:512])[0]
-    sentiment = result["label"]
-    confidence = result["score"]
-    if confidence < 0.6:
-        sentiment = "NEUTRAL"
-    return {"Sentiment": sentiment, "Confidence": round(confidence, 4)}
+    sentiment, confidence = predict_sentiment(snippet)
+    return {"Sentiment": sentiment, "Confidence": confidence}
 
 # --- Custom Interactive CSS ---
 custom_css = """
@@ -228,13 +602,14 @@ with gr.Blocks(css=custom_css, title="Interactive Sentiment App") as interface:
     text_input = gr.Textbox(label="Type your text here...", placeholder="e.g. I love using this app!", lines=4)
     output = gr.JSON(label="Sentiment Result")
     analyze_button = gr.Button("Analyze Sentiment")
-    analyze_button.click(gradio_sentiment, inputs=text_input, outputs=output)
-
-# --- Launch Gradio in background thread ---
-def launch_gradio():
-    interface.launch(server_name="0.0.0.0", server_port=7860, share=True)
+    # Without the queue each click is a plain request, so any worker can serve it
+    analyze_button.click(gradio_sentiment, inputs=text_input, outputs=output, queue=False)
 
-threading.Thread(target=launch_gradio, daemon=True).start()
+# --- Serve Gradio from the FastAPI app, sharing its model ---
+app = gr.mount_gradio_app(app, interface, path="/ui")
 
 if __name__ == "__main__":
+    # Single process for local runs; use `gunicorn app:app` (see gunicorn.conf.py)
+    # to serve from several workers. loop/http default to "auto", which picks
+    # uvloop and httptools when they are installed
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,15 +1,7 @@
 import gradio as gr
-from transformers import pipeline
-import time
 
-# Load the sentiment analysis model
-print("Loading DistilBERT model...")
-sentiment_pipeline = pipeline(
-    "sentiment-analysis",
-    model="distilbert-base-uncased-finetuned-sst-2-english",
-    device=-1
-)
-print("Model loaded successfully!")
+# Reuse the model loaded by the API instead of loading a second copy
+from app import MODEL_ID, predict_sentiment, warmup_model
 
 def analyze_sentiment(text):
     """
@@ -21,22 +13,16 @@ def analyze_sentiment(text):
     Returns:
         Tuple of (sentiment, confidence, html_output)
     """
-    if not text.strip():
+    snippet = text[:512].strip()  # Limit to 512 chars before stripping
+    if not snippet:
         return "⚠️ NEUTRAL", 0.0, "<p style='color: #666;'>Please enter some text to analyze.</p>"
     
     try:
-        # Add slight delay for animation effect
-        time.sleep(0.3)
-        
         # Get prediction
-        result = sentiment_pipeline(text[:512])[0]
-        
-        sentiment = result['label']
-        confidence = result['score']
+        sentiment, confidence = predict_sentiment(snippet)
         
-        # Determine sentiment with neutral threshold
-        if confidence < 0.6:
-            sentiment = "NEUTRAL"
+        # Low-confidence predictions come back as NEUTRAL
+        if sentiment == "NEUTRAL":
             emoji = "😐"
             color = "#FFA500"
         elif sentiment == "POSITIVE":
@@ -129,10 +115,10 @@ custom_css = """
 with gr.Blocks(css=custom_css, theme=gr.themes.Soft(primary_hue="purple")) as demo:
     gr.Markdown(
         """
-        # 🎭 Sentiment Analysis with DistilBERT
+        # 🎭 Sentiment Analysis with Transformers
         ### Analyze the emotional tone of your text in real-time
         
-        Powered by **DistilBERT** - a fast and accurate transformer model for sentiment classification.
+        Powered by a **distilled transformer** - a fast and accurate model for sentiment classification.
         """
     )
     
@@ -169,10 +155,10 @@ with gr.Blocks(css=custom_css, theme=gr.themes.Soft(primary_hue="purple")) as de
         html_output = gr.HTML(label="📈 Detailed Analysis")
     
     gr.Markdown(
-        """
+        f"""
         ---
         ### ℹ️ About
-        - **Model**: DistilBERT (distilbert-base-uncased-finetuned-sst-2-english)
+        - **Model**: {MODEL_ID}
         - **Categories**: Positive, Negative, Neutral (low confidence)
         - **Max Length**: 512 characters
         
@@ -199,6 +185,7 @@ with gr.Blocks(css=custom_css, theme=gr.themes.Soft(primary_hue="purple")) as de
 
 # Launch the app
 if __name__ == "__main__":
+    warmup_model()
     demo.launch(
         server_name="0.0.0.0",
         server_port=7860,
@@ -0,0 +1,31 @@
+from importlib.util import find_spec
+import multiprocessing
+import os
+
+# Check for a GPU through NVML so the check itself doesn't initialize CUDA
+os.environ.setdefault("PYTORCH_NVML_BASED_CUDA_CHECK", "1")
+import torch
+
+use_gpu = torch.cuda.is_available()
+use_onnx = find_spec("onnxruntime") is not None and find_spec("optimum") is not None
+
+# Serve app.py from several uvicorn worker processes. With the PyTorch CPU
+# backend the app (and its model) is loaded once in the master before forking,
+# so workers share the weights copy-on-write instead of each holding a copy.
+bind = "0.0.0.0:8000"
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = 120
+
+# On a GPU every worker would hold its own CUDA context and model copy, so run
+# a single worker by default and let the micro-batcher provide the concurrency
+default_workers = 1 if use_gpu else max(multiprocessing.cpu_count() // 2, 1)
+workers = int(os.environ.get("WEB_CONCURRENCY", default_workers))
+
+# Split the cores between workers so their thread pools don't oversubscribe;
+# app.py reads this when sizing its torch and ONNX Runtime thread pools
+os.environ.setdefault("OMP_NUM_THREADS", str(max(multiprocessing.cpu_count() // workers, 1)))
+
+# Neither CUDA nor ONNX Runtime's thread pools survive fork(), so with the GPU
+# or ONNX Runtime backend (chosen by app.py the same way) each worker loads its
+# own model instead
+preload_app = not use_gpu and not use_onnx
@@ -1,75 +1,95 @@
-import requests
+import asyncio
 import json
 
+import httpx
+
 # Base URL
 BASE_URL = "http://localhost:8000"
 
-def test_health():
+# Each check sends its requests before printing anything, so the output of
+# checks running concurrently doesn't interleave
+
+async def check_health(client):
     """Test health endpoint"""
+    response = await client.get("/health")
     print("\n🔍 Testing Health Endpoint...")
-    response = requests.get(f"{BASE_URL}/health")
     print(f"Status Code: {response.status_code}")
     print(f"Response: {json.dumps(response.json(), indent=2)}")
 
-def test_single_analysis():
+async def check_single_analysis(client):
     """Test single text analysis"""
-    print("\n🔍 Testing Single Text Analysis...")
-    
     test_cases = [
         "I absolutely love this product! It's amazing!",
         "This is terrible. I'm very disappointed.",
         "It's okay, nothing special."
     ]
-    
-    for text in test_cases:
-        response = requests.post(
-            f"{BASE_URL}/analyze",
-            json={"text": text}
-        )
+
+    # Send all texts at once so the server can batch them together
+    responses = await asyncio.gather(*[
+        client.post("/analyze", json={"text": text})
+        for text in test_cases
+    ])
+    print("\n🔍 Testing Single Text Analysis...")
+    for text, response in zip(test_cases, responses):
         print(f"\nText: {text}")
         print(f"Status Code: {response.status_code}")
         print(f"Response: {json.dumps(response.json(), indent=2)}")
 
-def test_batch_analysis():
+async def check_batch_analysis(client):
     """Test batch text analysis"""
-    print("\n🔍 Testing Batch Analysis...")
-    
     texts = [
         "Great service and friendly staff!",
         "Worst experience ever. Never again.",
         "Average product, nothing to complain about."
     ]
-    
-    response = requests.post(
-        f"{BASE_URL}/batch-analyze",
-        json={"texts": texts}
-    )
+
+    response = await client.post("/batch-analyze", json={"texts": texts})
+    print("\n🔍 Testing Batch Analysis...")
     print(f"Status Code: {response.status_code}")
     print(f"Response: {json.dumps(response.json(), indent=2)}")
 
-def test_error_handling():
+async def check_batch_stream_analysis(client):
+    """Test streamed batch text analysis"""
+    texts = [
+        "Great service and friendly staff!",
+        "Worst experience ever. Never again.",
+        "Average product, nothing to complain about."
+    ]
+
+    async with client.stream("POST", "/batch-analyze", json={"texts": texts, "stream": True}) as response:
+        lines = [line async for line in response.aiter_lines() if line]
+    print("\n🔍 Testing Streamed Batch Analysis...")
+    print(f"Status Code: {response.status_code}")
+    for line in lines:
+        print(f"Result: {json.dumps(json.loads(line), indent=2)}")
+
+async def check_error_handling(client):
     """Test error handling"""
-    print("\n🔍 Testing Error Handling...")
-    
     # Empty text
-    response = requests.post(
-        f"{BASE_URL}/analyze",
-        json={"text": ""}
-    )
+    response = await client.post("/analyze", json={"text": ""})
+    print("\n🔍 Testing Error Handling...")
     print(f"\nEmpty text - Status Code: {response.status_code}")
     print(f"Response: {json.dumps(response.json(), indent=2)}")
 
+async def main():
+    """Run all checks concurrently through one client and its connection pool"""
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=30) as client:
+        await asyncio.gather(
+            check_health(client),
+            check_single_analysis(client),
+            check_batch_analysis(client),
+            check_batch_stream_analysis(client),
+            check_error_handling(client)
+        )
+
 if __name__ == "__main__":
     print("=" * 50)
     print("🧪 Sentiment Analysis API Tests")
     print("=" * 50)
-    
+
     try:
-        test_health()
-        test_single_analysis()
-        test_batch_analysis()
-        test_error_handling()
-        
+        asyncio.run(main())
+
         print("\n" + "=" * 50)
         print("✅ All tests completed!")
         print("=" * 50)